@@ -15,9 +15,107 @@ from insilico_stimuli.parameters import *
 
 from tqdm import tqdm
 
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from joblib import Parallel, delayed
+except ImportError:  # joblib is optional, without it images_parallel falls back to concurrent.futures
+    Parallel = None
+
+try:
+    import numexpr as ne
+except ImportError:  # numexpr is optional, it speeds up the Gabors computed without numba
+    ne = None
+
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:  # numba is optional, without it the stimuli are computed with numpy
+    njit = None
+
+# the parallel numba kernels already use all cores, and the 'workqueue' threading layer of numba aborts on concurrent
+# kernel launches. Kernel calls from several threads (e.g. the prefetching in 'image_batches') are serialized.
+_kernel_lock = threading.Lock()
+
+
+if njit is not None:
+    @njit(inline='always', fastmath=True)
+    def _gabor_pixel(dx, dy, cos_o, sin_o, a, b, c, sf2pi, phase):
+        """ Envelope times grating at the offset (dx, dy) from the center, a, b, c as in 'GaborSet._envelope'. """
+        x = cos_o * dx - sin_o * dy
+        return np.exp(-(a * dx * dx + b * dy * dy + c * dx * dy)) * np.cos(sf2pi * x + phase)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _gabor_kernel(out, xs, ys, lx, ly, cos_o, sin_o, a, b, c, sf2pi, phase, amplitude, grey_level):
+        """ Writes a single Gabor into 'out' with shape (image height, image width). """
+        for i in prange(ys.shape[0]):
+            for j in range(xs.shape[0]):
+                out[i, j] = amplitude * _gabor_pixel(xs[j] - lx, ys[i] - ly, cos_o, sin_o, a, b, c, sf2pi,
+                                                     phase) + grey_level
+
+    # batch kernel with the canvas size as literal loop bounds, which lets the compiler unroll and vectorize the
+    # pixel loops for the given canvas
+    _GABOR_BATCH_KERNEL_TEMPLATE = """
+@njit(parallel=True, fastmath=True)
+def _gabor_batch_kernel(out, lx, ly, cos_o, sin_o, a, b, c, sf2pi, phase, amplitude, grey_level):
+    for k in prange(out.shape[0]):
+        for i in range({height}):
+            dy = dtype(i) - ly[k]
+            for j in range({width}):
+                out[k, i, j] = amplitude[k] * _gabor_pixel(dtype(j) - lx[k], dy, cos_o[k], sin_o[k], a[k], b[k], c[k],
+                                                           sf2pi[k], phase[k]) + grey_level[k]
+"""
+    _gabor_batch_kernels = {}
+
+    def _make_gabor_kernel(width, height, dtype):
+        """
+        Compiles a batch kernel specialized to a canvas size, which writes a batch of Gabors into 'out' with shape
+        (batch size, image height, image width). The kernels are cached per canvas size and data type.
+
+        Args:
+            width (int): The width of the canvas.
+            height (int): The height of the canvas.
+            dtype (type): The data type of the generated images.
+
+        Returns: The compiled kernel.
+        """
+        key = (width, height, dtype)
+        if key not in _gabor_batch_kernels:
+            namespace = {'njit': njit, 'prange': prange, '_gabor_pixel': _gabor_pixel, 'dtype': dtype}
+            exec(_GABOR_BATCH_KERNEL_TEMPLATE.format(width=int(width), height=int(height)), namespace)
+            _gabor_batch_kernels[key] = namespace['_gabor_batch_kernel']
+        return _gabor_batch_kernels[key]
+else:
+    _gabor_kernel = _make_gabor_kernel = None
+
+
+def _compute_chunk_single_threaded(stimuli_set, start, end):
+    """
+    Computes a chunk of images in a worker process of 'StimuliSet.images_parallel'. The workers already run in parallel,
+    so numba and numexpr are limited to one thread each to not oversubscribe the cores.
+
+    Args:
+        stimuli_set (StimuliSet): The set of stimuli.
+        start (int): The index of the first parameter combination of the chunk.
+        end (int): The index after the last parameter combination of the chunk.
+
+    Returns: The images as numpy.ndarray with shape (end - start, image height, image width).
+    """
+    if njit is not None:
+        set_num_threads(1)
+    if ne is not None:
+        ne.set_num_threads(1)
+    return stimuli_set._compute_chunk(start, end)
+
+
 class StimuliSet:
     """
     Base class for all other stimuli classes.
+
+    The parameter combinations ('params', 'num_params') are cached on first use. After changing parameter attributes
+    of an instance (e.g. 'self.sizes'), call 'invalidate_cache'.
     """
     def __init__(self):
         pass
@@ -25,16 +123,44 @@ class StimuliSet:
     def params(self):
         raise NotImplementedError
 
+    def _get_params(self):
+        """
+        Returns:
+            list: The output of the 'params' method, which is built once and cached.
+        """
+        if getattr(self, '_params_cache', None) is None:
+            self._params_cache = self.params()
+        return self._params_cache
+
     def num_params(self):
         """
         Returns:
             list: Number of different input parameters for each parameter from the 'params' method.
         """
-        return [len(p[0]) for p in self.params()]
+        if getattr(self, '_num_params_cache', None) is None:
+            self._num_params_cache = [len(p[0]) for p in self._get_params()]
+        return self._num_params_cache
+
+    def invalidate_cache(self):
+        """ Clears the cached parameter combinations. Needs to be called after changing parameter attributes. """
+        self._params_cache = None
+        self._num_params_cache = None
+        self._param_arrays_cache = None
+        self._param_trig_cache = None
 
     def stimulus(self, *args, **kwargs):
         raise NotImplementedError
 
+    def _trig(self, angle):
+        """
+        Args:
+            angle (float): angle in radians.
+
+        Returns:
+            tuple: cosine and sine of 'angle' in the data type of the generated images ('_dtype').
+        """
+        return self._dtype(np.cos(angle)), self._dtype(np.sin(angle))
+
     def params_from_idx(self, idx):
         """
         labels the different parameter combinations.
@@ -47,7 +173,53 @@ class StimuliSet:
         """
         num_params = self.num_params()
         c = np.unravel_index(idx, num_params)
-        params = [p[0][c[i]] for i, p in enumerate(self.params())]  # p[0] is parameter content
+        params = [p[0][c[i]] for i, p in enumerate(self._get_params())]  # p[0] is parameter content
+        return params
+
+    def _param_arrays(self):
+        """
+        Converts the parameter values from the 'params' method (e.g. the list of locations) once into contiguous
+        numpy.ndarrays, which are reused for the fancy indexing in '_params_from_indices'.
+
+        Returns:
+            list: one numpy.ndarray per parameter in the data type of the generated images ('_dtype'), the locations
+                with shape (number of locations, 2).
+        """
+        if getattr(self, '_param_arrays_cache', None) is None:
+            self._param_arrays_cache = [np.ascontiguousarray(p[0], dtype=self._dtype) for p in self._get_params()]
+        return self._param_arrays_cache
+
+    def _param_trig(self, name):
+        """
+        Tabulates cosine and sine of all values of an angle parameter. The tables are cached like '_param_arrays'.
+
+        Args:
+            name (str): The name of the angle parameter as given in the 'params' method (e.g. 'orientation').
+
+        Returns:
+            tuple: cosine and sine as numpy.ndarray in '_dtype', indexed like the parameter values.
+        """
+        if getattr(self, '_param_trig_cache', None) is None:
+            self._param_trig_cache = {}
+        if name not in self._param_trig_cache:
+            names = [p[1] for p in self._get_params()]
+            values = self._param_arrays()[names.index(name)]
+            self._param_trig_cache[name] = np.cos(values), np.sin(values)
+        return self._param_trig_cache[name]
+
+    def _params_from_indices(self, indices):
+        """
+        Vectorized version of 'params_from_idx'.
+
+        Args:
+            indices (array_like of int): The indices of the desired parameter combinations.
+
+        Returns:
+            list: one numpy.ndarray per parameter holding its values for all 'indices' along the first axis, in the data
+                type of the generated images ('_dtype').
+        """
+        c = np.unravel_index(np.asarray(indices), self.num_params())
+        params = [values[c[i]] for i, values in enumerate(self._param_arrays())]
         return params
 
     def params_dict_from_idx(self, idx):
@@ -59,7 +231,7 @@ class StimuliSet:
             dict: dictionary of the parameter combination specified in 'idx'
         """
         params = self.params_from_idx(idx)
-        return {p[1]: params[i] for i, p in enumerate(self.params())}
+        return {p[1]: params[i] for i, p in enumerate(self._get_params())}
 
     def stimulus_from_idx(self, idx):
         """
@@ -70,21 +242,106 @@ class StimuliSet:
         """
         return self.stimulus(**self.params_dict_from_idx(idx))
 
-    def image_batches(self, batch_size):
+    def stimulus_batch(self, indices):
+        """
+        Args:
+            indices (sequence of int): The indices of the desired parameter combinations.
+
+        Returns: The images as numpy.ndarray with shape (len(indices), image height, image width). Subclasses may
+            override this method with a vectorized implementation.
+        """
+        images = np.empty((len(indices), self.canvas_size[1], self.canvas_size[0]),
+                          dtype=getattr(self, '_dtype', np.float64))
+        for k, idx in enumerate(indices):
+            image = self.stimulus_from_idx(idx)
+            # images of a set may differ in data type (e.g. integer bars), promote the batch instead of truncating
+            dtype = np.result_type(images.dtype, image.dtype, np.float32)
+            if dtype != images.dtype:
+                images = images.astype(dtype)
+            images[k] = image
+        return images
+
+    def _compute_chunk(self, start, end):
+        """
+        Args:
+            start (int): The index of the first parameter combination of the chunk.
+            end (int): The index after the last parameter combination of the chunk.
+
+        Returns: The images as numpy.ndarray with shape (end - start, image height, image width).
+        """
+        return self.stimulus_batch(range(start, end))
+
+    def image_batches(self, batch_size, n_workers=None):
         """
         Generator function dividing the resulting images from all parameter combinations into batches.
 
         Args:
             batch_size (int): The number of images per batch.
+            n_workers (int or None): If given, up to this many upcoming batches are computed in background threads
+                while the current batch is consumed. Calls of the compiled numba kernels, which already use all cores,
+                are serialized between the threads. Default is None, which computes each batch when it is requested.
 
         Yields: The image batches as numpy.ndarray with shape (batch_size, image height, image width) or
                 (num_params % batch_size, image height, image width), for the last batch.
         """
-        num_stims = np.prod(self.num_params())
-        for batch_start in np.arange(0, num_stims, batch_size):
-            batch_end = np.minimum(batch_start + batch_size, num_stims)
-            images = [self.stimulus_from_idx(i) for i in range(batch_start, batch_end)]
-            yield np.array(images)
+        num_stims = int(np.prod(self.num_params()))
+        if n_workers is None:
+            for batch_start in range(0, num_stims, batch_size):
+                batch_end = min(batch_start + batch_size, num_stims)
+                yield self._compute_chunk(batch_start, batch_end)
+            return
+
+        if num_stims == 0:
+            return
+
+        # compute the first batch on the calling thread, which starts the thread pool of the parallel numba kernels
+        # there. Started on a short-lived worker thread, the TBB threading layer hangs at interpreter exit.
+        first_batch = self._compute_chunk(0, min(batch_size, num_stims))
+
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        pending = deque()
+        try:
+            for batch_start in range(batch_size, num_stims, batch_size):
+                batch_end = min(batch_start + batch_size, num_stims)
+                pending.append(executor.submit(self._compute_chunk, batch_start, batch_end))
+                if first_batch is not None and len(pending) == n_workers:
+                    yield first_batch
+                    first_batch = None
+                elif len(pending) > n_workers:
+                    yield pending.popleft().result()
+            if first_batch is not None:
+                yield first_batch
+            while pending:
+                yield pending.popleft().result()
+        finally:  # do not compute batches that will not be consumed anymore
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+
+    def images_parallel(self, n_workers=None, chunk_size=256):
+        """
+        Generates the images for the desired stimuli in parallel worker processes.
+
+        Args:
+            n_workers (int or None): The number of worker processes. Default is None, which uses all CPU cores.
+            chunk_size (int): The number of images computed by a worker at a time.
+
+        Returns: The images of all possible parameter combinations as numpy.ndarray with shape
+        ('total number of parameter combinations', 'image height', 'image width')
+        """
+        num_stims = int(np.prod(self.num_params()))
+        chunks = [(start, min(start + chunk_size, num_stims)) for start in range(0, num_stims, chunk_size)]
+        if Parallel is not None:
+            n_jobs = -1 if n_workers is None else n_workers
+            results = Parallel(n_jobs=n_jobs, backend='loky')(
+                delayed(_compute_chunk_single_threaded)(self, start, end) for start, end in chunks
+            )
+        else:
+            # spawn the workers, forking after the compiled kernels started their thread pools can deadlock
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+                results = list(executor.map(_compute_chunk_single_threaded, [self] * len(chunks), *zip(*chunks)))
+        return np.concatenate(results)
 
     def images(self):
         """
@@ -93,8 +350,8 @@ class StimuliSet:
         Returns: The images of all possible parameter combinations as numpy.ndarray with shape
         ('total number of parameter combinations', 'image height', 'image width')
         """
-        num_stims = np.prod(self.num_params())
-        return np.array([self.stimulus_from_idx(i) for i in range(num_stims)])
+        num_stims = int(np.prod(self.num_params()))
+        return self.stimulus_batch(range(num_stims))
 
 
 class BarsSet(StimuliSet):
@@ -579,6 +836,17 @@ class GaborSet(StimuliSet):
         else:
             raise TypeError('pixel_boundaries must be of type list.')
 
+        # data type of the generated images and coordinate axes of the canvas, shared by all stimuli
+        self._dtype = np.float32
+        self._xs = np.arange(self.canvas_size[0], dtype=self._dtype)
+        self._ys = np.arange(self.canvas_size[1], dtype=self._dtype)
+
+        # batch kernel compiled for the canvas size, if numba is available
+        if _make_gabor_kernel is not None:
+            self._kernel = _make_gabor_kernel(self.canvas_size[0], self.canvas_size[1], self._dtype)
+        else:
+            self._kernel = None
+
         # relative_sf
         if relative_sf is None:
             self.relative_sf = False
@@ -685,14 +953,39 @@ class GaborSet(StimuliSet):
 
     def params_from_idx(self, idx):
         """ returns the parameter combination for a desired image index from an enumerable set of images. """
-        num_params = self.num_params()
-        c = np.unravel_index(idx, num_params)
-        params = [p[0][c[i]] for i, p in enumerate(self.params())]
+        return self._params_from_unravelled(np.unravel_index(idx, self.num_params()))
+
+    def _params_from_unravelled(self, c):
+        """ returns the parameter combination for the unravelled image index 'c', one index per parameter. """
+        params = [p[0][c[i]] for i, p in enumerate(self._get_params())]
         # Caution changing the class methods: it is crucial that the index of params matches the correct parameter
         if self.relative_sf:
             params[2] /= params[1]  # params[2] is spatial_frequency and params[1] is size.
         return params
 
+    def stimulus_from_idx(self, idx):
+        """
+        Args:
+            idx (int): The index of the desired parameter combination
+
+        Returns: The image as numpy.ndarray with pixel values belonging to the parameter combinations of index 'idx'.
+            The orientation index is passed on, so that 'stimulus' looks up cosine and sine of the orientation.
+        """
+        if getattr(self, '_param_names', None) is None:  # the names and order of the parameters never change
+            self._param_names = [p[1] for p in self._get_params()]
+            self._orient_pos = self._param_names.index('orientation')
+
+        c = np.unravel_index(idx, self.num_params())
+        params = dict(zip(self._param_names, self._params_from_unravelled(c)))
+        return self.stimulus(_orient_idx=c[self._orient_pos], **params)
+
+    def _params_from_indices(self, indices):
+        """ returns the parameter combinations for an array of image indices, one numpy.ndarray per parameter. """
+        params = super()._params_from_indices(indices)
+        if self.relative_sf:
+            params[2] = params[2] / params[1]  # params[2] is spatial_frequency and params[1] is size.
+        return params
+
     def _parameter_converter(self):
         """ Reads out the type of all the ordinary input arguments and converts them to attributes. """
         for arg_key in self.arg_dict:
@@ -738,7 +1031,56 @@ class GaborSet(StimuliSet):
         S_inv = np.diag(1 / np.array(gammas))
         return np.exp(-0.5 * np.sum(xy @ R @ S_inv @ R.T * xy, axis=-1) / (size / 4)**2)
 
-    def stimulus(self, location, size, spatial_frequency, contrast, orientation, phase, gamma, grey_level, **kwargs):
+    @staticmethod
+    def _envelope_coefficients(size, cos_o, sin_o, gamma):
+        """
+        Expands the quadratic form of the Gaussian envelope exp(-(x_rot^2 / gamma + y_rot^2) / (2 * sd^2)), given in the
+        rotated coordinates of the grating with sd = size / 4, into a*x^2 + b*y^2 + c*x*y in canvas coordinates.
+
+        Args:
+            size (float or numpy.ndarray): The lengths of the longer axis of the envelopes.
+            cos_o (float or numpy.ndarray): The cosine of the orientations of the normal to the parallel stripes.
+            sin_o (float or numpy.ndarray): The sine of the orientations of the normal to the parallel stripes.
+            gamma (float or numpy.ndarray): The spatial aspect ratios reflecting the ellipticity of the envelopes.
+
+        Returns:
+            tuple: the coefficients a, b and c.
+        """
+        inv2s2 = 1 / (2 * (size / 4)**2)
+        a = (cos_o * cos_o / gamma + sin_o * sin_o) * inv2s2
+        b = (sin_o * sin_o / gamma + cos_o * cos_o) * inv2s2
+        c = 2 * cos_o * sin_o * (1 - 1 / gamma) * inv2s2
+        return a, b, c
+
+    @staticmethod
+    def _envelope(dx, dy, a, b, c):
+        """
+        Computes the Gaussian envelope as outer product of two 1D Gaussians along the canvas axes. The mixed term c*x*y
+        only vanishes for a circular envelope (gamma=1, the default) or an envelope aligned with the canvas axes. Only
+        for the remaining stimuli, the exponent is evaluated on the full grid (splitting off exp(-c*x*y) would overflow
+        for very elongated envelopes).
+
+        Args:
+            dx (numpy.ndarray): x-coordinates relative to the centers with shape (batch size, 1, image width).
+            dy (numpy.ndarray): y-coordinates relative to the centers with shape (batch size, image height, 1).
+            a, b, c (float or numpy.ndarray): The coefficients from '_envelope_coefficients'.
+
+        Returns: Envelope values as numpy.ndarray with shape (batch size, image height, image width).
+        """
+        a = np.reshape(a, (-1, 1, 1))
+        b = np.reshape(b, (-1, 1, 1))
+        c = np.reshape(c, (-1, 1, 1))
+
+        qx = a * dx * dx
+        qy = b * dy * dy
+        envelope = np.exp(-qx) * np.exp(-qy)
+        mixed = c.ravel() != 0
+        if np.any(mixed):
+            envelope[mixed] = np.exp(-(qx[mixed] + qy[mixed] + c[mixed] * dx[mixed] * dy[mixed]))
+        return envelope
+
+    def stimulus(self, location, size, spatial_frequency, contrast, orientation, phase, gamma, grey_level,
+                 _orient_idx=None, **kwargs):
         """
         Args:
             location (list of float): The center position of the Gabor.
@@ -749,33 +1091,269 @@ class GaborSet(StimuliSet):
             phase (float): The phase offset of the cosine factor.
             gamma (float): The spatial aspect ratio reflecting the ellipticity of the Gabor.
             grey_level (float): The mean luminance.
+            _orient_idx (int or None): The index of 'orientation' in 'self.orientations', if known. Used internally to
+                look up cosine and sine of the orientation.
             **kwargs: Arbitrary keyword arguments.
 
         Returns: Image of the desired Gabor stimulus as numpy.ndarray.
         """
-        x, y = np.meshgrid(np.arange(self.canvas_size[0]) - location[0],
-                           np.arange(self.canvas_size[1]) - location[1])
-        coords = np.stack([x.flatten(), y.flatten()])
+        dtype = self._dtype
+        if _orient_idx is None:
+            cos_o, sin_o = self._trig(orientation)
+        else:
+            cos_table, sin_table = self._param_trig('orientation')
+            cos_o, sin_o = cos_table[_orient_idx], sin_table[_orient_idx]
+        a, b, c = self._envelope_coefficients(dtype(size), cos_o, sin_o, dtype(gamma))
+        sf2pi, phase = dtype(spatial_frequency * (2*pi)), dtype(phase)
+        amplitude = contrast * min(abs(self.pixel_boundaries[0] - grey_level),
+                                   abs(self.pixel_boundaries[1] - grey_level))
 
-        # rotation matrix R for envelope
-        R_env = np.array([[np.cos(-orientation - np.pi/2), -np.sin(-orientation - np.pi/2)],
-                      [np.sin(-orientation - np.pi/2),  np.cos(-orientation - np.pi/2)]])
-        envelope = self.density(np.stack((x, y), axis=-1), gammas=[1, gamma], R=R_env, size=size)
+        if _gabor_kernel is not None:
+            gabor = np.empty((self.canvas_size[1], self.canvas_size[0]), dtype=dtype)
+            with _kernel_lock:
+                _gabor_kernel(gabor, self._xs, self._ys, dtype(location[0]), dtype(location[1]), cos_o, sin_o, a, b,
+                              c, sf2pi, phase, dtype(amplitude), dtype(grey_level))
+            return gabor
 
-        # rotation matrix for grating
-        R = np.array([[np.cos(orientation), -np.sin(orientation)],
-                      [np.sin(orientation),  np.cos(orientation)]])
-        x, y = R.dot(coords).reshape((2, ) + x.shape)
-        grating = np.cos(spatial_frequency * (2*pi) * x + phase)
+        dx = self._xs - dtype(location[0])
+        dy = self._ys - dtype(location[1])
+        if ne is not None:
+            return self._gabor_numexpr(dx[None, :], dy[:, None], cos_o, sin_o, a, b, c, sf2pi, phase,
+                                       dtype(amplitude), dtype(grey_level))
 
-        # add contrast
-        gabor_no_contrast = envelope * grating
-        amplitude = contrast * min(abs(self.pixel_boundaries[0] - grey_level),
-                                   abs(self.pixel_boundaries[1] - grey_level))
-        gabor = amplitude * gabor_no_contrast + grey_level
+        envelope = self._envelope(dx[None, None, :], dy[None, :, None], a, b, c)[0]
+
+        gabor = self._stimulus_with_precomputed(dx, dy, envelope, cos_o, sin_o, sf2pi, phase, amplitude)
+        gabor += grey_level
 
         return gabor
 
+    @staticmethod
+    def _gabor_numexpr(dx, dy, cos_o, sin_o, a, b, c, sf2pi, phase, amplitude, grey_level):
+        """
+        Evaluates envelope, grating, contrast and grey level in a single multi-threaded numexpr pass, without
+        intermediate arrays. All arguments broadcast against each other and are expected in the data type of the
+        generated images, a, b, c as in '_envelope'.
+
+        Returns: The Gabors as numpy.ndarray with the broadcast shape of the arguments.
+        """
+        return ne.evaluate('amplitude * exp(-(a * dx * dx + b * dy * dy + c * dx * dy)) * '
+                           'cos(sf2pi * (cos_o * dx - sin_o * dy) + phase) + grey_level',
+                           local_dict={'dx': dx, 'dy': dy, 'cos_o': cos_o, 'sin_o': sin_o, 'a': a, 'b': b, 'c': c,
+                                       'sf2pi': sf2pi, 'phase': phase, 'amplitude': amplitude,
+                                       'grey_level': grey_level})
+
+    @staticmethod
+    def _stimulus_with_precomputed(dx, dy, envelope, cos_o, sin_o, sf2pi, phase, amplitude):
+        """
+        Computes a Gabor without grey level from coordinates and envelope that can be shared between Gabors.
+
+        Args:
+            dx (numpy.ndarray): x-coordinates relative to the center with shape (image width,).
+            dy (numpy.ndarray): y-coordinates relative to the center with shape (image height,).
+            envelope (numpy.ndarray): The Gaussian envelope with shape (image height, image width). Not modified.
+            cos_o (float): The cosine of the orientation of the normal to the parallel stripes.
+            sin_o (float): The sine of the orientation of the normal to the parallel stripes.
+            sf2pi (float): The spatial frequency times 2*pi.
+            phase (float): The phase offset of the cosine factor.
+            amplitude (float): The amplitude of the Gabor in pixel values.
+
+        Returns: The Gabor as numpy.ndarray with shape (image height, image width).
+        """
+        # rotated coordinate along the normal to the stripes
+        x = cos_o * dx[None, :] - sin_o * dy[:, None]
+        x *= sf2pi
+        x += phase
+        gabor = np.cos(x, out=x)
+
+        # add contrast, in place on the grating
+        gabor *= envelope
+        gabor *= amplitude
+        return gabor
+
+    def _gabor_batch(self, location, size, spatial_frequency, orientation, phase, gamma, amplitude, grey_level):
+        """
+        Computes a batch of Gabors in one broadcast over (batch size, image height, image width).
+
+        Args:
+            location (numpy.ndarray): The center positions of the Gabors with shape (batch size, 2). All arguments are
+                expected in the data type of the generated images ('_dtype').
+            size (numpy.ndarray): The lengths of the longer axis of the Gabor envelopes.
+            spatial_frequency (numpy.ndarray): The inverse of the wavelengths of the cosine factors.
+            orientation (numpy.ndarray): The orientations of the normal to the parallel stripes.
+            phase (numpy.ndarray): The phase offsets of the cosine factors.
+            gamma (numpy.ndarray): The spatial aspect ratios reflecting the ellipticity of the Gabors.
+            amplitude (numpy.ndarray): The amplitudes of the Gabors in pixel values.
+            grey_level (numpy.ndarray): The mean luminances.
+
+        Returns: Images of the Gabors as numpy.ndarray with shape (batch size, image height, image width).
+        """
+        cos_o = np.cos(orientation)
+        sin_o = np.sin(orientation)
+        a, b, c = self._envelope_coefficients(size, cos_o, sin_o, gamma)
+
+        if self._kernel is not None:
+            gabors = np.empty((len(size), self.canvas_size[1], self.canvas_size[0]), dtype=self._dtype)
+            with _kernel_lock:
+                self._kernel(gabors, location[:, 0], location[:, 1], cos_o, sin_o, a, b, c,
+                             spatial_frequency * (2*pi), phase, amplitude, grey_level)
+            return gabors
+
+        dx = self._xs[None, None, :] - location[:, 0, None, None]
+        dy = self._ys[None, :, None] - location[:, 1, None, None]
+        if ne is not None:
+            return self._gabor_numexpr(dx, dy, *[np.reshape(p, (-1, 1, 1)) for p in (
+                cos_o, sin_o, a, b, c, spatial_frequency * (2*pi), phase, amplitude, grey_level)])
+
+        envelope = self._envelope(dx, dy, a, b, c)
+
+        # rotated coordinate along the normal to the stripes
+        x = cos_o[:, None, None] * dx - sin_o[:, None, None] * dy
+        x *= (spatial_frequency * (2*pi))[:, None, None]
+        x += phase[:, None, None]
+        grating = np.cos(x, out=x)
+
+        # add contrast, in place on the envelope
+        gabors = np.multiply(envelope, grating, out=envelope)
+        gabors *= amplitude[:, None, None]
+        gabors += grey_level[:, None, None]
+
+        return gabors
+
+    def stimulus_batch(self, indices):
+        """
+        Args:
+            indices (sequence of int): The indices of the desired parameter combinations.
+
+        Returns: Images of the desired Gabor stimuli as numpy.ndarray with shape (len(indices), image height,
+            image width).
+        """
+        location, size, spatial_frequency, contrast, orientation, phase, gamma, grey_level = \
+            self._params_from_indices(indices)
+        amplitude = contrast * np.minimum(np.abs(self.pixel_boundaries[0] - grey_level),
+                                          np.abs(self.pixel_boundaries[1] - grey_level))
+        return self._gabor_batch(location, size, spatial_frequency, orientation, phase, gamma, amplitude, grey_level)
+
+    def images(self):
+        """
+        Generates the images for the desired stimuli. The argument of the cosine factor only depends on location, size,
+        spatial frequency and orientation. Its cosine and sine are computed once per combination of these and shifted
+        to all phases with cos(x + phase) = cos(x) * cos(phase) - sin(x) * sin(phase). The envelopes are computed once
+        per gamma, contrasts and grey levels are applied last.
+
+        Returns: The images of all possible parameter combinations as numpy.ndarray with shape
+        ('total number of parameter combinations', 'image height', 'image width')
+        """
+        dtype = self._dtype
+        width, height = self.canvas_size
+        location, size, spatial_frequency, contrast, orientation, phase, gamma, grey_level = self._param_arrays()
+        cos_o, sin_o = self._param_trig('orientation')
+        cos_p, sin_p = self._param_trig('phase')
+
+        # amplitudes with shape (contrasts, 1, 1, grey levels, 1, 1) to broadcast against (phases, gammas, 1, H, W)
+        max_amplitude = np.minimum(np.abs(self.pixel_boundaries[0] - grey_level),
+                                   np.abs(self.pixel_boundaries[1] - grey_level))
+        amplitude = (contrast[:, None] * max_amplitude[None, :])[:, None, None, :, None, None]
+
+        images = np.empty(self.num_params() + [height, width], dtype=dtype)
+        for l, s, f, o in np.ndindex(len(location), len(size), len(spatial_frequency), len(orientation)):
+            dx = self._xs - location[l, 0]
+            dy = self._ys - location[l, 1]
+            sf = spatial_frequency[f] / size[s] if self.relative_sf else spatial_frequency[f]
+
+            # cosine and sine of the grating argument, combined into the gratings of all phases
+            x = (cos_o[o] * dx)[None, :] - (sin_o[o] * dy)[:, None]
+            x *= dtype(sf * (2*pi))
+            cos_x, sin_x = np.cos(x), np.sin(x)
+            gratings = cos_x * cos_p[:, None, None]
+            gratings -= sin_x * sin_p[:, None, None]
+
+            a, b, c = self._envelope_coefficients(size[s], cos_o[o], sin_o[o], gamma)
+            envelopes = self._envelope(np.broadcast_to(dx, (len(gamma), 1, width)),
+                                       np.broadcast_to(dy[:, None], (len(gamma), height, 1)), a, b, c)
+
+            # images[l, s, f, :, o] has shape (contrasts, phases, gammas, grey levels, H, W)
+            out = images[l, s, f, :, o]
+            np.multiply(amplitude, gratings[None, :, None, None] * envelopes[None, None, :, None], out=out)
+            out += grey_level[:, None, None]
+
+        return images.reshape((-1, height, width))
+
+    def _gabor_batch_torch(self, location, size, spatial_frequency, orientation, phase, gamma, amplitude, grey_level):
+        """
+        Computes a batch of Gabors with torch on the device of the given tensors. The arguments are those of
+        '_gabor_batch', given as torch.Tensor.
+
+        Returns: Images of the Gabors as torch.Tensor with shape (batch size, image height, image width).
+        """
+        cos_o = torch.cos(orientation)[:, None, None]
+        sin_o = torch.sin(orientation)[:, None, None]
+        a, b, c = self._envelope_coefficients(size[:, None, None], cos_o, sin_o, gamma[:, None, None])
+
+        xs = torch.as_tensor(self._xs, device=location.device)
+        ys = torch.as_tensor(self._ys, device=location.device)
+        dx = xs[None, None, :] - location[:, 0, None, None]
+        dy = ys[None, :, None] - location[:, 1, None, None]
+
+        envelope = torch.exp(-(a * dx * dx + b * dy * dy + c * dx * dy))
+        grating = torch.cos((spatial_frequency * (2*pi))[:, None, None] * (cos_o * dx - sin_o * dy) +
+                            phase[:, None, None])
+        return envelope * grating * amplitude[:, None, None] + grey_level[:, None, None]
+
+    def _stimulus_batch_torch(self, indices, device):
+        """
+        Args:
+            indices (sequence of int): The indices of the desired parameter combinations.
+            device (torch.device): The device on which the images are generated.
+
+        Returns: Images of the desired Gabor stimuli as torch.Tensor with shape (len(indices), image height,
+            image width).
+        """
+        location, size, spatial_frequency, contrast, orientation, phase, gamma, grey_level = \
+            [torch.as_tensor(p, device=device) for p in self._params_from_indices(indices)]
+        amplitude = contrast * torch.min(torch.abs(self.pixel_boundaries[0] - grey_level),
+                                         torch.abs(self.pixel_boundaries[1] - grey_level))
+        return self._gabor_batch_torch(location, size, spatial_frequency, orientation, phase, gamma, amplitude,
+                                       grey_level)
+
+    def images_gpu(self, indices=None, device=None, as_numpy=False, batch_size=1024):
+        """
+        Generates the images for the desired stimuli with torch on the GPU, ready to be passed to a model without a
+        round trip through host memory.
+
+        Args:
+            indices (sequence of int or None): The indices of the desired parameter combinations. Default is None,
+                which generates the images of all parameter combinations.
+            device (torch.device or str or None): The device on which the images are generated. Default is None, which
+                uses 'cuda' if available and 'cpu' otherwise.
+            as_numpy (bool): If True, the images are copied to the host and returned as numpy.ndarray with shape
+                (number of images, image height, image width) like 'images()'. Default is False.
+            batch_size (int): The number of images computed at a time, which bounds the memory of the intermediate
+                tensors on the device. Default is 1024.
+
+        Returns: The images as torch.Tensor with shape (number of images, 1, image height, image width) on 'device'.
+        """
+        if indices is None:
+            indices = range(int(np.prod(self.num_params())))
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        device = torch.device(device)
+
+        shape = (len(indices), self.canvas_size[1], self.canvas_size[0])
+        if as_numpy:  # copy each batch to the host, so that only one batch is kept on the device
+            images = np.empty(shape, dtype=self._dtype)
+        else:
+            images = torch.empty(shape, dtype=getattr(torch, np.dtype(self._dtype).name), device=device)
+
+        for batch_start in range(0, len(indices), batch_size):
+            batch_end = min(batch_start + batch_size, len(indices))
+            batch = self._stimulus_batch_torch(indices[batch_start:batch_end], device)
+            images[batch_start:batch_end] = batch.cpu().numpy() if as_numpy else batch
+
+        if as_numpy:
+            return images
+        return images.unsqueeze(1)
+
     def _param_dict_for_search(self, locations, sizes, spatial_frequencies, contrasts, orientations, phases, gammas,
                                grey_levels):
         """
@@ -1184,7 +1762,7 @@ class PlaidsGaborSet(GaborSet):
         ]
 
     def stimulus(self, location, size, spatial_frequency, orientation, phase, gamma, grey_level,
-                 contrast_preferred, contrast_overlap, angle, **kwargs):
+                 contrast_preferred, contrast_overlap, angle, _orient_idx=None, **kwargs):
         """
         Args:
             location (list of float): The center position of the Plaid.
@@ -1197,35 +1775,88 @@ class PlaidsGaborSet(GaborSet):
             contrast_preferred (float): Defines the amplitude of the preferred Gabor in %. Takes values from 0 to 1.
             contrast_overlap (float): Defines the amplitude of the orthogonal Gabor in %. Takes values from 0 to 1.
             angle (float): angle of the overlapping Gabor to the preferred Gabor.
+            _orient_idx (int or None): The index of 'orientation' in 'self.orientations', if known. Only applies to the
+                preferred Gabor.
             **kwargs: Arbitrary keyword arguments.
 
         Returns: Pixel intensities of the desired Plaid stimulus as numpy.ndarray.
         """
-        gabor_preferred = super().stimulus(
-            location=location,
-            size=size,
-            spatial_frequency=spatial_frequency,
-            contrast=contrast_preferred,
-            orientation=orientation,
-            phase=phase,
-            gamma=gamma,
-            grey_level=grey_level,
-            **kwargs
-        )
+        dtype = self._dtype
+        if _orient_idx is None:
+            cos_p, sin_p = self._trig(orientation)
+        else:
+            cos_table, sin_table = self._param_trig('orientation')
+            cos_p, sin_p = cos_table[_orient_idx], sin_table[_orient_idx]
+        cos_o, sin_o = self._trig(orientation + angle)
+        size, gamma = dtype(size), dtype(gamma)
+        sf2pi, phase = dtype(spatial_frequency * (2*pi)), dtype(phase)
+        max_amplitude = min(abs(self.pixel_boundaries[0] - grey_level), abs(self.pixel_boundaries[1] - grey_level))
+
+        # coordinates are shared by both Gabors, the envelope only for a circular envelope (gamma=1)
+        dx = self._xs - dtype(location[0])
+        dy = self._ys - dtype(location[1])
+        envelope = self._envelope(dx[None, None, :], dy[None, :, None],
+                                  *self._envelope_coefficients(size, cos_p, sin_p, gamma))[0]
+        plaid = self._stimulus_with_precomputed(dx, dy, envelope, cos_p, sin_p, sf2pi, phase,
+                                                contrast_preferred * max_amplitude)
+
+        if gamma != 1:
+            envelope = self._envelope(dx[None, None, :], dy[None, :, None],
+                                      *self._envelope_coefficients(size, cos_o, sin_o, gamma))[0]
+        plaid += self._stimulus_with_precomputed(dx, dy, envelope, cos_o, sin_o, sf2pi, phase,
+                                                 contrast_overlap * max_amplitude)
+
+        plaid += dtype(2 * grey_level)  # the grey levels of both Gabors
 
-        gabor_overlap = super().stimulus(
-            location=location,
-            size=size,
-            spatial_frequency=spatial_frequency,
-            contrast=contrast_overlap,
-            orientation=orientation + angle,
-            phase=phase,
-            gamma=gamma,
-            grey_level=grey_level,
-            **kwargs
-        )
+        return plaid
+
+    def stimulus_batch(self, indices):
+        """
+        Args:
+            indices (sequence of int): The indices of the desired parameter combinations.
+
+        Returns: Pixel intensities of the desired Plaid stimuli as numpy.ndarray with shape (len(indices), image
+            height, image width).
+        """
+        location, size, spatial_frequency, orientation, phase, gamma, contrast_preferred, contrast_overlap, angle, \
+            grey_level = self._params_from_indices(indices)
+        max_amplitude = np.minimum(np.abs(self.pixel_boundaries[0] - grey_level),
+                                   np.abs(self.pixel_boundaries[1] - grey_level))
+
+        plaid = self._gabor_batch(location, size, spatial_frequency, orientation, phase, gamma,
+                                  contrast_preferred * max_amplitude, grey_level)
+        plaid += self._gabor_batch(location, size, spatial_frequency, orientation + angle, phase, gamma,
+                                   contrast_overlap * max_amplitude, grey_level)
+
+        return plaid
+
+    def images(self):
+        """
+        Generates the images for the desired stimuli.
+
+        Returns: The images of all possible parameter combinations as numpy.ndarray with shape
+        ('total number of parameter combinations', 'image height', 'image width')
+        """
+        return StimuliSet.images(self)  # the parameters differ from those factored in 'GaborSet.images'
+
+    def _stimulus_batch_torch(self, indices, device):
+        """
+        Args:
+            indices (sequence of int): The indices of the desired parameter combinations.
+            device (torch.device): The device on which the images are generated.
+
+        Returns: Pixel intensities of the desired Plaid stimuli as torch.Tensor with shape (len(indices), image
+            height, image width).
+        """
+        location, size, spatial_frequency, orientation, phase, gamma, contrast_preferred, contrast_overlap, angle, \
+            grey_level = [torch.as_tensor(p, device=device) for p in self._params_from_indices(indices)]
+        max_amplitude = torch.min(torch.abs(self.pixel_boundaries[0] - grey_level),
+                                  torch.abs(self.pixel_boundaries[1] - grey_level))
 
-        plaid = gabor_preferred + gabor_overlap
+        plaid = self._gabor_batch_torch(location, size, spatial_frequency, orientation, phase, gamma,
+                                        contrast_preferred * max_amplitude, grey_level)
+        plaid += self._gabor_batch_torch(location, size, spatial_frequency, orientation + angle, phase, gamma,
+                                         contrast_overlap * max_amplitude, grey_level)
 
         return plaid
 
@@ -1277,6 +1908,9 @@ class DiffOfGaussians(StimuliSet):
         else:
             raise TypeError('pixel_boundaries must be of type list.')
 
+        # data type of the generated images
+        self._dtype = np.float32
+
         # Treat the stimulus-relevant arguments
         # locations
         if isinstance(locations, list):
@@ -1309,6 +1943,11 @@ class DiffOfGaussians(StimuliSet):
         # read out the other input arguments and store them in class attributes
         self._parameter_converter()
 
+        # the surround has to be larger than the center for all stimuli, including those of the search methods
+        scales_surround = list(self.sizes_scale_surround) + list(getattr(self, 'sizes_scale_surround_range', []))
+        if min(scales_surround) <= 1:
+            raise ValueError("all values of sizes_scale_surround must be larger than 1.")
+
         # For this class search methods, we want to get the parameters in an ax-friendly format
         type_check = []
         for arg in self.arg_dict:
@@ -1379,6 +2018,17 @@ class DiffOfGaussians(StimuliSet):
         r2 = np.sum(np.square(coords - mean), axis=1)
         return np.exp(-r2 / (2 * scale**2))
 
+    @staticmethod
+    def _gaussian_1d(d, scale):
+        """
+        Args:
+            d (numpy.ndarray): The distances of the evaluation points to the mean along one axis.
+            scale (float): The standard deviation of the Gaussian.
+
+        Returns: Unnormalized 1D Gaussian density values evaluated at the distances 'd' as numpy.ndarray.
+        """
+        return np.exp(-(d * d) / (2 * scale**2))
+
     def stimulus(self, location, size, size_scale_surround, contrast, contrast_scale_surround, grey_level, **kwargs):
         """
         Args:
@@ -1393,26 +2043,27 @@ class DiffOfGaussians(StimuliSet):
 
         Returns: Pixel intensities for desired Difference of Gaussians stimulus as numpy.ndarray.
         """
-        if size_scale_surround <= 1:
-            raise ValueError("size_surround must be larger than 1.")
-
-        x, y = np.meshgrid(np.arange(self.canvas_size[0]),
-                           np.arange(self.canvas_size[1]))
-        coords = np.stack([x.flatten(), y.flatten()], axis=-1).reshape(-1, 2)
+        # both Gaussians are isotropic and thus separable into the outer product of 1D Gaussians along y and x
+        dtype = self._dtype
+        dx = np.arange(self.canvas_size[0], dtype=dtype) - dtype(location[0])
+        dy = np.arange(self.canvas_size[1], dtype=dtype) - dtype(location[1])
+        scale_center, scale_surround = dtype(size), dtype(size_scale_surround * size)
 
-        center = self.gaussian_density(coords, mean=location, scale=size).reshape(self.canvas_size[::-1])
-        surround = self.gaussian_density(coords, mean=location, scale=(size_scale_surround * size)
-                                         ).reshape(self.canvas_size[::-1])
-        center_surround = center - contrast_scale_surround * surround
+        center = np.outer(self._gaussian_1d(dy, scale_center), self._gaussian_1d(dx, scale_center))
+        surround = np.outer(self._gaussian_1d(dy, scale_surround), self._gaussian_1d(dx, scale_surround))
+        surround *= contrast_scale_surround
+        center_surround = np.subtract(center, surround, out=center)
 
-        # add contrast
+        # add contrast, in place on center_surround
         min_val, max_val = center_surround.min(), center_surround.max()
         amplitude_current = max(np.abs(min_val), np.abs(max_val))
         amplitude_required = contrast * min(np.abs(self.pixel_boundaries[0] - grey_level),
                                             np.abs(self.pixel_boundaries[1] - grey_level))
         contrast_scaling = amplitude_required / amplitude_current
 
-        diff_of_gaussians = contrast_scaling * center_surround + grey_level
+        diff_of_gaussians = center_surround
+        diff_of_gaussians *= contrast_scaling
+        diff_of_gaussians += grey_level
 
         return diff_of_gaussians
 
@@ -1796,6 +2447,20 @@ class CenterSurround(StimuliSet):
         # Read out the 'ordinary' input arguments and save them as attributes
         self._parameter_converter()
 
+        # the center must not be larger than the surround for all stimuli, including those of the search methods
+        sizes_center = list(self.sizes_center) + list(getattr(self, 'sizes_center_range', []))
+        sizes_surround = list(self.sizes_surround) + list(getattr(self, 'sizes_surround_range', []))
+        if max(sizes_center) > min(sizes_surround):
+            raise ValueError("sizes_center cannot be larger than sizes_surround.")
+
+        # data type of the generated images, coordinate axes of the canvas and cosine and sine of all orientations,
+        # shared by all stimuli
+        self._dtype = np.float32
+        self._xs = np.arange(self.canvas_size[0], dtype=self._dtype)
+        self._ys = np.arange(self.canvas_size[1], dtype=self._dtype)
+        self._trig_table = {o: (self._dtype(np.cos(o)), self._dtype(np.sin(o)))
+                            for o in list(self.orientations_center) + list(self.orientations_surround)}
+
         # spatial_frequencies_surround
         if spatial_frequencies_surround is None:
             self.spatial_frequencies_surround = [-6666]  # random iterable label of length>0 beyond parameter range
@@ -1902,7 +2567,7 @@ class CenterSurround(StimuliSet):
 
         num_params = self.num_params()
         c = np.unravel_index(idx, num_params)
-        params = [p[0][c[i]] for i, p in enumerate(self.params())]
+        params = [p[0][c[i]] for i, p in enumerate(self._get_params())]
 
         # if phases_surround was not specified, use the value of phases_center
         if self.phases_surround == [-6666]:
@@ -1913,6 +2578,23 @@ class CenterSurround(StimuliSet):
             params[9] = params[8]
         return params
 
+    def _trig(self, angle):
+        """
+        Looks up cosine and sine of an angle in the table of the class instance ('_trig_table'), which is filled with
+        the center and surround orientations at instantiation. Angles not in the table (e.g. from the search methods)
+        are computed.
+
+        Args:
+            angle (float): angle in radians.
+
+        Returns:
+            tuple: cosine and sine of 'angle' in the data type of the generated images ('_dtype').
+        """
+        trig = self._trig_table.get(angle)
+        if trig is None:
+            trig = super()._trig(angle)
+        return trig
+
     def _parameter_converter(self):
         """ Reads out the type of all the ordinary input arguments and converts them to attributes. """
         for arg_key in self.arg_dict:
@@ -2004,31 +2686,26 @@ class CenterSurround(StimuliSet):
 
         Returns: Pixel intensities of the desired Center-Surround stimulus as numpy.ndarray.
         """
+        x = (self._xs - self._dtype(location[0]))[None, :]
+        y = (self._ys - self._dtype(location[1]))[:, None]
 
-        if size_center > size_surround:
-            raise ValueError("size_center cannot be larger than size_surround.")
+        # rotated coordinates along the normal to the stripes of center and surround
+        cos_c, sin_c = self._trig(orientation_center)
+        x_center = cos_c * x - sin_c * y
 
-        x, y = np.meshgrid(np.arange(self.canvas_size[0]) - location[0],
-                           np.arange(self.canvas_size[1]) - location[1])
-
-        R_center = np.array([[np.cos(orientation_center), -np.sin(orientation_center)],
-                             [np.sin(orientation_center),  np.cos(orientation_center)]])
-
-        R_surround = np.array([[np.cos(orientation_surround), -np.sin(orientation_surround)],
-                               [np.sin(orientation_surround),  np.cos(orientation_surround)]])
-
-        coords = np.stack([x.flatten(), y.flatten()])
-        x_center, y_center = R_center.dot(coords).reshape((2, ) + x.shape)
-        x_surround, y_surround = R_surround.dot(coords).reshape((2, ) + x.shape)
+        cos_s, sin_s = self._trig(orientation_surround)
+        x_surround = cos_s * x - sin_s * y
 
-        norm_xy_center = np.sqrt(x_center ** 2 + y_center ** 2)
-        norm_xy_surround = np.sqrt(x_surround ** 2 + y_surround ** 2)
+        # the norm does not change under rotation, compare the squared norm against the squared radii
+        norm2_xy = x * x + y * y
 
-        envelope_center = (norm_xy_center <= size_center * size_total)
-        envelope_surround = (norm_xy_surround > size_surround * size_total) * (norm_xy_surround <= size_total)
+        envelope_center = norm2_xy <= (size_center * size_total) ** 2
+        envelope_surround = norm2_xy > (size_surround * size_total) ** 2
+        np.logical_and(envelope_surround, norm2_xy <= size_total ** 2, out=envelope_surround)
 
-        grating_center = np.cos(spatial_frequency_center * x_center * (2*pi) + phase_center)
-        grating_surround = np.cos(spatial_frequency_surround * x_surround * (2*pi) + phase_surround)
+        grating_center = np.cos(self._dtype(spatial_frequency_center * (2*pi)) * x_center + self._dtype(phase_center))
+        grating_surround = np.cos(self._dtype(spatial_frequency_surround * (2*pi)) * x_surround +
+                                  self._dtype(phase_surround))
 
         # add contrast
         amplitude_center = contrast_center * min(abs(self.pixel_boundaries[0] - grey_level),
@@ -2036,10 +2713,12 @@ class CenterSurround(StimuliSet):
         amplitude_surround = contrast_surround * min(abs(self.pixel_boundaries[0] - grey_level),
                                                      abs(self.pixel_boundaries[1] - grey_level))
 
-        grating_center_contrast = amplitude_center * grating_center
-        grating_surround_contrast = amplitude_surround * grating_surround
+        # center and surround do not overlap, write both gratings with contrast into one image through their masks
+        center_surround = np.zeros_like(grating_center)
+        np.multiply(grating_center, amplitude_center, out=center_surround, where=envelope_center)
+        np.multiply(grating_surround, amplitude_surround, out=center_surround, where=envelope_surround)
 
-        return envelope_center * grating_center_contrast + envelope_surround * grating_surround_contrast
+        return center_surround
 
     def _param_dict_for_search(self, locations, sizes_total, sizes_center, sizes_surround, contrasts_center,
                                contrasts_surround, orientations_center, orientations_surround,
@@ -2478,7 +3157,7 @@ class PlaidsGratingSet(CenterSurround):
     def params_from_idx(self, idx):
         num_params = self.num_params()
         c = np.unravel_index(idx, num_params)
-        params = [p[0][c[i]] for i, p in enumerate(self.params())]
+        params = [p[0][c[i]] for i, p in enumerate(self._get_params())]
         return params
 
     def stimulus(self, location, size_total, contrast_preferred, contrast_overlap, orientation, angle,